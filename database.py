@@ -1,5 +1,10 @@
+import operator
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
-from helpers import datetime_to_str
+from itertools import compress, tee
+from operator import attrgetter
+
+from filters import compile_filters
 
 class CDCTrackingDatabase:
     """A database of Covid tracking data.
@@ -7,16 +12,61 @@ class CDCTrackingDatabase:
     A `CDCTrackingDatabase` contains a collection of cdc tracking data from
     2020-01-13 to 2021-03-07 of all US states.
     It additionally maintains a few auxiliary data structures to
-    help fetch tracking data by date and by US state abbreviation.
+    help fetch tracking data by date and by US state abbreviation, and
+    column-wise copies of the attributes used to evaluate queries.
     """
     def __init__(self, cdcObjs):
-        self._cdcObjs = cdcObjs
-        self._data_by_date = defaultdict(list)
-        self._data_by_state = defaultdict(list)
+        """Create a new `CDCTrackingDatabase`.
+
+        :param cdcObjs: An iterable of `CDCTrackingObject`s, consumed in a single
+            pass that stores and indexes each object.
+        """
+        self._cdcObjs = []
+        self._data_by_date = by_date = defaultdict(list)
+        self._data_by_state = by_state = defaultdict(list)
+        self._columns = {}
+        self._date_index = None
+
+        append = self._cdcObjs.append
+        for d in cdcObjs:
+            append(d)
+            by_date[d.date_str].append(d)
+            by_state[d.state].append(d)
+
+    def __getstate__(self):
+        """Pickle the tracking data and its indexes, leaving out the column caches.
+
+        Columns and the date index are rebuilt on first use, so a database sent
+        to another process only carries what cannot be derived cheaply.
+        """
+        state = self.__dict__.copy()
+        state['_columns'] = {}
+        state['_date_index'] = None
+        return state
 
-        for _, d in enumerate(self._cdcObjs):
-            self._data_by_date[datetime_to_str(d.date)].append(d)
-            self._data_by_state[d.state].append(d)
+    def __len__(self):
+        return len(self._cdcObjs)
+
+    def __iter__(self):
+        return iter(self._cdcObjs)
+
+    def __getitem__(self, row):
+        return self._cdcObjs[row]
+
+    def column(self, name):
+        """Return the values of one attribute for all the tracking data objects.
+
+        Columns are built on first use and kept, so that queries scan a flat
+        tuple instead of fetching an attribute from every object.
+
+        :param name: The name of a `CDCTrackingObject` attribute.
+        :return: A tuple of that attribute's values, in database order.
+        """
+        try:
+            return self._columns[name]
+        except KeyError:
+            column = self._columns[name] = tuple(map(attrgetter(name), self._cdcObjs))
+            return column
 
     def get_tracking_data_by_date(self, date):
         return self._data_by_date[date]
@@ -24,17 +74,78 @@ class CDCTrackingDatabase:
     def get_tracking_data_by_state(self, state):
         return self._data_by_state[state]
 
+    def _rows_in_date_range(self, filters):
+        """Apply the date filters that can be answered from a sorted date index.
+
+        Rows are sorted by date once, on first use. The bounds of the filters
+        that `compares_column` of dates with `==`, `>=` or `<=` are then found
+        by binary search.
+
+        :param filters: A collection of filters capturing user-specified criteria.
+        :return: A tuple of the positions of the rows within the date bounds, in
+            database order (or None if there are no date bounds), and a list of
+            the filters left to apply.
+        """
+        lo, hi = 0, len(self._cdcObjs)
+        bounded = False
+        remaining = []
+        for f in filters:
+            if (f.field == 'date_only' and f.compares_column()
+                    and f.op in (operator.eq, operator.ge, operator.le)):
+                if self._date_index is None:
+                    dates = self.column('date_only')
+                    order = sorted(range(len(dates)), key=dates.__getitem__)
+                    self._date_index = (order, [dates[row] for row in order])
+                order, sorted_dates = self._date_index
+                if f.op is not operator.le:
+                    lo = max(lo, bisect_left(sorted_dates, f.value))
+                if f.op is not operator.ge:
+                    hi = min(hi, bisect_right(sorted_dates, f.value))
+                bounded = True
+            else:
+                remaining.append(f)
+
+        if not bounded:
+            return None, remaining
+        return sorted(self._date_index[0][lo:hi]), remaining
+
+    def _chain_filters(self, filters, rows):
+        """Apply filters one after the other, lazily.
+
+        Each filter is only evaluated on the rows that passed the previous ones,
+        so the most selective filters should come first. This is still a single
+        pass over the columns.
+
+        :param filters: A collection of filters capturing user-specified criteria.
+        :param rows: Positions of the rows to filter, or None for all of them.
+        :return: An iterator of the positions of the matching rows, in database order.
+        """
+        for f in filters:
+            if rows is None:
+                rows = compress(range(len(self._cdcObjs)), f.mask(self))
+            else:
+                rows, probe = tee(rows)
+                rows = compress(rows, f.mask(self, probe))
+        return rows
+
     def query(self, filters=()):
         """
         :param filters: A collection of filters capturing user-specified criteria.
         :return: A stream of matching COVID tracking data objects.
         """
+        # Narrow the search down to the rows within the date bounds, if any.
+        rows, filters = self._rows_in_date_range(filters)
+
         if filters:
-            for obj in self._cdcObjs:
-                if all(map(lambda f: f(obj), filters)):
-                    yield obj
-        else:
-            # return all the COVID tracking data objects if they are no filters
-            for obj in self._cdcObjs:
-                yield obj
+            # Evaluate the remaining filters with a kernel compiled for this
+            # query shape, or chain them if some filter can't be compiled.
+            select = compile_filters(filters)
+            if select is None:
+                rows = self._chain_filters(filters, rows)
+            else:
+                rows = select(self, range(len(self._cdcObjs)) if rows is None else rows)
 
+        if rows is None:
+            yield from self._cdcObjs
+        else:
+            yield from map(self._cdcObjs.__getitem__, rows)
@@ -1,67 +1,272 @@
 import csv
 import json
 import datetime
+import os
+import pathlib
+from itertools import islice
+from operator import itemgetter
 
 from models import CDCTrackingObject
 from helpers import datetime_to_str
 from collections import defaultdict
 
 
-def load_cdc_data(data_csv_path):
-    """Read CDC tracking information from a CSV file.
+# Columns of the CSV file holding counts. An empty cell is read as 0.
+INT_FIELDS = (
+    "death",
+    "deathIncrease",
+    "hospitalizedCumulative",
+    "hospitalizedCurrently",
+    "inIcuCurrently",
+    "negative",
+    "onVentilatorCumulative",
+    "onVentilatorCurrently",
+    "positive",
+    "totalTestResultsIncrease",
+    "totalTestsAntibody",
+    "totalTestsAntigen",
+    "totalTestsViral",
+)
+
+
+# Columns of the CSV file kept in each row, in order.
+FIELDS = ("date", "state") + INT_FIELDS
+
+# Types of the values in a row of `FIELDS`.
+ROW_TYPES = (str, str) + (int,) * len(INT_FIELDS)
+
+
+class StaleCacheError(Exception):
+    """A cache of parsed CSV rows can't be used for the current CSV file."""
+
+
+def iter_cdc_rows(data_csv_path):
+    """Read the columns of interest from a CDC tracking CSV file, one row at a time.
 
     :param data_csv_path: A path to a CSV file containing data about cdc tracking data.
-    :return: A collection of `Covid Tracking Object`s.
+    :yield: Tuples of the values in `FIELDS`, with counts as ints.
     """
-    with open(data_csv_path, "r") as infile:
-        reader = csv.DictReader(infile)
-        cdcTrackingObjs = []
+    with open(data_csv_path, "r", newline="") as infile:
+        reader = csv.reader(infile)
+        # Look up the positions of the columns of interest once, from the header,
+        # rather than building a dict for every line as `csv.DictReader` does.
+        header = next(reader)
+        date_col = header.index("date")
+        state_col = header.index("state")
+        counts_of = itemgetter(*map(header.index, INT_FIELDS))
+        width = len(header)
         for line in reader:
-            line["date"] = line["date"]
-            line["state"] = line["state"]
-            line["death"] = int(line["death"]) if line["death"] else 0
-            line["deathIncrease"] = int(line["deathIncrease"]) if line["deathIncrease"] else 0
-            line["hospitalizedCumulative"] = int(line["hospitalizedCumulative"]) if line["hospitalizedCumulative"] else 0
-            line["hospitalizedCurrently"] = int(line["hospitalizedCurrently"]) if line["hospitalizedCurrently"] else 0
-            line["inIcuCurrently"] = int(line["inIcuCurrently"]) if line["inIcuCurrently"] else 0
-            line["negative"] = int(line["negative"]) if line["negative"] else 0
-            line["onVentilatorCumulative"] = int(line["onVentilatorCumulative"]) if line["onVentilatorCumulative"] else 0
-            line["onVentilatorCurrently"] = int(line["onVentilatorCurrently"]) if line["onVentilatorCurrently"] else 0
-            line["positive"] = int(line["positive"]) if line["positive"] else 0
-            line["totalTestResultsIncrease"] = int(line["totalTestResultsIncrease"]) if line["totalTestResultsIncrease"] else 0
-            line["totalTestsAntibody"] = int(line["totalTestsAntibody"]) if line["totalTestsAntibody"] else 0
-            line["totalTestsAntigen"] = int(line["totalTestsAntigen"]) if line["totalTestsAntigen"] else 0
-            line["totalTestsViral"] = int(line["totalTestsViral"]) if line["totalTestsViral"] else 0
+            # Like `csv.DictReader`, skip blank lines and read missing cells of
+            # short lines as empty.
+            if not line:
+                continue
+            if len(line) < width:
+                line += [""] * (width - len(line))
+            counts = [int(v) if v else 0 for v in counts_of(line)]
+            yield (line[date_col], line[state_col], *counts)
+
+
+def read_cdc_rows(data_csv_path):
+    """Read the columns of interest from a CDC tracking CSV file.
+
+    :param data_csv_path: A path to a CSV file containing data about cdc tracking data.
+    :return: A list of tuples of the values in `FIELDS`, with counts as ints.
+    """
+    return list(iter_cdc_rows(data_csv_path))
+
+
+def source_of(data_csv_path):
+    """Identify the current contents of a CSV file by its size and modification time.
+
+    :param data_csv_path: A path to a CSV file.
+    :return: A dict of the file's `size` and `mtime_ns`, as recorded in its cache.
+    """
+    stat = data_csv_path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _read_json_line(infile, cache_path):
+    """Read the next line of a cache, decoded from JSON, or None at its end."""
+    try:
+        line = infile.readline()
+        return json.loads(line) if line else None
+    except (OSError, ValueError) as e:
+        raise StaleCacheError(cache_path) from e
+
+
+def iter_cached_rows(cache_path, source):
+    """Read the rows cached for a CDC tracking CSV file by `cache_rows`, one at a time.
+
+    The cache holds one JSON value per line: a header recording the `source`
+    and `FIELDS` it was written for, an array per row, and a trailer counting
+    the rows, which tells a complete cache from a truncated one.
+
+    :param cache_path: A path to the cache of the CSV file.
+    :param source: The `source_of` the CSV file the cache must have been written for.
+    :yield: Tuples of the values in `FIELDS`, with counts as ints.
+    :raise StaleCacheError: If the cache is missing, unreadable, written for another
+        version of the CSV file, or not of the expected shape. This is raised
+        before the first row if the header doesn't match, and otherwise at the
+        first bad line, once the rows before it were produced.
+    """
+    try:
+        infile = open(cache_path, "r")
+    except OSError as e:
+        raise StaleCacheError(cache_path) from e
+    with infile:
+        header = _read_json_line(infile, cache_path)
+        if (not isinstance(header, dict) or header.get("source") != source
+                or header.get("fields") != list(FIELDS)):
+            raise StaleCacheError(cache_path)
+        count = 0
+        value = _read_json_line(infile, cache_path)
+        while isinstance(value, list):
+            row = tuple(value)
+            if tuple(map(type, row)) != ROW_TYPES:
+                raise StaleCacheError(cache_path)
+            count += 1
+            yield row
+            value = _read_json_line(infile, cache_path)
+        if (not isinstance(value, dict) or value.get("rows") != count
+                or _read_json_line(infile, cache_path) is not None):
+            raise StaleCacheError(cache_path)
+
+
+def _discard(outfile, tmp_path):
+    """Close and remove a cache that is not to be used."""
+    try:
+        outfile.close()
+    except OSError:
+        pass
+    try:
+        tmp_path.unlink()
+    except OSError:
+        pass
+
+
+def cache_rows(rows, cache_path, source):
+    """Pass rows of a CDC tracking CSV file through, writing them to a cache.
+
+    The cache is written to a temporary file, which only replaces `cache_path`
+    once every row went through. A cache that can't be written is skipped: the
+    cache only saves time, and a read-only data directory is fine.
+
+    :param rows: An iterable of tuples of the values in `FIELDS`.
+    :param cache_path: A path to the cache to write.
+    :param source: The `source_of` the CSV file the rows were read from.
+    :yield: The rows, unchanged.
+    """
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        outfile = open(tmp_path, "w")
+    except OSError:
+        outfile = None
+    try:
+        if outfile is not None:
+            try:
+                outfile.write(json.dumps({"source": source, "fields": FIELDS}) + "\n")
+            except OSError:
+                _discard(outfile, tmp_path)
+                outfile = None
+        count = 0
+        for row in rows:
+            if outfile is not None:
+                try:
+                    outfile.write(json.dumps(row, separators=(",", ":")) + "\n")
+                except OSError:
+                    _discard(outfile, tmp_path)
+                    outfile = None
+            count += 1
+            yield row
+        if outfile is not None:
             try:
-                cdcData = CDCTrackingObject(
-                    date = line["date"],
-                    state = line["state"],
-                    death = line["death"],
-                    deathIncrease = line["deathIncrease"],
-                    hospitalizedCumulative = line["hospitalizedCumulative"],
-                    hospitalizedCurrently = line["hospitalizedCurrently"],
-                    inIcuCurrently = line["inIcuCurrently"],
-                    negative = line["negative"],
-                    onVentilatorCumulative = line["onVentilatorCumulative"],
-                    onVentilatorCurrently = line["onVentilatorCurrently"],
-                    positive = line["positive"],
-                    totalTestResultsIncrease = line["totalTestResultsIncrease"],
-                    totalTestsAntibody = line["totalTestsAntibody"],
-                    totalTestsAntigen = line["totalTestsAntigen"],
-                    totalTestsViral = line["totalTestsViral"],
-                )
-            except Exception as e:
-                print(e)
+                outfile.write(json.dumps({"rows": count}) + "\n")
+                outfile.close()
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                pass
             else:
-                cdcTrackingObjs.append(cdcData)
-    return cdcTrackingObjs
+                outfile = None
+    finally:
+        # Not every row went through, or the cache couldn't be put in place.
+        if outfile is not None:
+            _discard(outfile, tmp_path)
+
+
+def iter_cached_cdc_rows(data_csv_path):
+    """Read the rows of a CDC tracking CSV file, one at a time, through a cache.
+
+    The parsed rows are cached next to the CSV file, under its name with a
+    `.cache.json` suffix added. The cache is used as long as it was written
+    for a CSV file of the same size and modification time, for the current
+    `FIELDS`, and holds rows of `ROW_TYPES`; otherwise the CSV file is parsed
+    again and the cache rewritten. Either way, rows are produced as they are
+    read, without collecting them.
+
+    :param data_csv_path: A path to a CSV file containing data about cdc tracking data.
+    :yield: Tuples of the values in `FIELDS`, with counts as ints.
+    """
+    data_csv_path = pathlib.Path(data_csv_path)
+    cache_path = data_csv_path.with_name(data_csv_path.name + ".cache.json")
+    # Identify the CSV file before reading it, so that a cache written while it
+    # changes doesn't match it afterwards.
+    source = source_of(data_csv_path)
+    produced = 0
+    try:
+        for row in iter_cached_rows(cache_path, source):
+            yield row
+            produced += 1
+        return
+    except StaleCacheError:
+        pass
+    # Parse the CSV file, past the rows a cache found bad midway produced.
+    rows = cache_rows(iter_cdc_rows(data_csv_path), cache_path, source)
+    yield from islice(rows, produced, None)
+
+
+def load_cached_cdc_rows(data_csv_path):
+    """Read the rows of a CDC tracking CSV file, through a cache.
+
+    See `iter_cached_cdc_rows` for how the cache is used.
+
+    :param data_csv_path: A path to a CSV file containing data about cdc tracking data.
+    :return: A list of tuples of the values in `FIELDS`, with counts as ints.
+    """
+    return list(iter_cached_cdc_rows(data_csv_path))
+
+
+def iter_cdc_data(data_csv_path):
+    """Read CDC tracking information from a CSV file, one object at a time.
+
+    This lets a consumer such as `CDCTrackingDatabase` store and index each
+    object as it is built, without an intermediate collection.
+
+    :param data_csv_path: A path to a CSV file containing data about cdc tracking data.
+    :yield: `Covid Tracking Object`s, in file order.
+    """
+    for row in iter_cached_cdc_rows(data_csv_path):
+        try:
+            cdcData = CDCTrackingObject(*row)
+        except Exception as e:
+            print(e)
+        else:
+            yield cdcData
+
+
+def load_cdc_data(data_csv_path):
+    """Read CDC tracking information from a CSV file.
+
+    :param data_csv_path: A path to a CSV file containing data about cdc tracking data.
+    :return: A collection of `Covid Tracking Object`s.
+    """
+    return list(iter_cdc_data(data_csv_path))
 
 if __name__ == ('__main__'):
    objs = load_cdc_data('data/all-states-history.csv')
 
    data_by_date = defaultdict(list)
    data_by_state = defaultdict(list)
-   for _, d in enumerate(objs):
+   for d in objs:
       data_by_date[datetime_to_str(d.date)].append(d)
       data_by_state[d.state].append(d)
 
@@ -77,7 +282,7 @@ if __name__ == ('__main__'):
    print(data_by_state['WI'][-1])
   
    print(f'total number of data for CA: {len(data_by_state["CA"])}')
-   for _, d in enumerate(data_by_state['CA']):
+   for d in data_by_state['CA']:
       print(d)
 
    print(len(objs))
@@ -8,13 +8,19 @@ the main module and originate from the user's command-line options.
 This function returns a collection of instances of subclasses
 of `AttributeFilter` - a 1-argument callable constructed from a comparator, a
 reference value, and a class method `get` that subclasses can override to
-fetch an attribute of interest.
+fetch an attribute of interest. Filters that name the attribute they read
+in `field` can also be evaluated over a whole database column at once with
+`mask`, which is how `query` applies them.
+
+The `compile_filters` function generates and caches one Python function per
+query shape that evaluates a whole collection of such filters in one loop.
 
 The `limit` function simply limits the maximum number of values produced by an
 iterator.
 
 """
 import operator
+from itertools import islice, repeat
 
 
 class UnsupportedCriterionError(NotImplementedError):
@@ -35,8 +41,17 @@ class AttributeFilter:
 
     Concrete subclasses can override the `get` classmethod to provide custom
     behavior to fetch a desired attribute from the given `covid data object`.
+    Subclasses that read a plain attribute should also name it in `field`.
     """
-    
+
+    # The `CDCTrackingObject` attribute returned by `get`, or None if unknown.
+    field = None
+
+    # Rough fraction of covid data objects passing a filter of this class.
+    # `create_filters` orders filters by it, so that `query` applies the most
+    # selective ones first.
+    selectivity_hint = 0.5
+
     def __init__(self, op, value):
         """Construct a new `AttributeFilter` from an binary predicate and a reference value.
 
@@ -67,6 +82,70 @@ class AttributeFilter:
         """
         raise UnsupportedCriterionError
 
+    @classmethod
+    def reads_field(cls):
+        """Return whether filters of this class compare the plain attribute named by `field`.
+
+        That only holds if neither `get` nor `__call__` is overridden in a
+        subclass of the class that declared `field`: such a subclass inherits
+        `field` but no longer reads it as is. `mask` then compares the `values`
+        of the field rather than calling the filter on each object.
+
+        :return: True if the filter can be evaluated over the `field` values.
+        """
+        if cls.field is None:
+            return False
+        mro = cls.__mro__
+
+        def declared_at(name):
+            return next(i for i, klass in enumerate(mro) if name in vars(klass))
+
+        field_at = declared_at('field')
+        return declared_at('get') >= field_at and declared_at('__call__') >= field_at
+
+    def compares_column(self):
+        """Return whether this filter is a plain comparison of the column named by `field`.
+
+        That is the case when the filter `reads_field`, uses one of the usual
+        comparators, and doesn't override `mask` or `values`. Only then can code
+        other than `mask`, such as `compile_filters` or a database index, answer
+        the filter from the `field` column directly.
+
+        :return: True if the filter can be answered from the `field` column.
+        """
+        cls = type(self)
+        return (cls.reads_field() and self.op in _OPERATOR_SYMBOLS
+                and cls.mask is AttributeFilter.mask
+                and cls.values is AttributeFilter.values)
+
+    def mask(self, db, rows=None):
+        """Evaluate this filter on the covid data objects of a database.
+
+        The comparison runs over the database column named by `field`, without
+        calling `get` once per object. Filters that don't `reads_field` fall back
+        to calling the filter on each object.
+
+        :param db: A `CDCTrackingDatabase` to evaluate this filter on.
+        :param rows: Positions of the objects to evaluate, or None for all of them.
+        :return: An iterator of booleans, one per evaluated object, in order.
+        """
+        if not self.reads_field():
+            # Calling the bound `__call__` skips the type-slot dispatch per object.
+            return map(self.__call__, db if rows is None else map(db.__getitem__, rows))
+        return map(self.op, self.values(db, rows), repeat(self.value))
+
+    def values(self, db, rows=None):
+        """Return the `field` of the covid data objects of a database.
+
+        :param db: A `CDCTrackingDatabase` holding the covid data objects.
+        :param rows: Positions of the objects to read, or None for all of them.
+        :return: An iterable of attribute values, comparable to `self.value` via `self.op`.
+        """
+        column = db.column(self.field)
+        if rows is None:
+            return column
+        return map(column.__getitem__, rows)
+
     def __repr__(self):
         """Repr method used to compare filter attribute."""
         return f"{self.__class__.__name__}(op=operator.{self.op.__name__}, value={self.value})"
@@ -74,21 +153,29 @@ class AttributeFilter:
 class DateFilter(AttributeFilter):
     """Subclass of AttributeFilter to filter covid data object objects by date."""
 
+    field = 'date_only'
+    # Date bounds are answered from the database's date index before any
+    # other filter; a single date matches one day out of a few hundred.
+    selectivity_hint = 0.003
+
     @classmethod
     def get(cls, covid_data):
-        """Return covid_data.date converted to datetime.datetime object for the date filter.
+        """Return covid_data.date_only, the date of covid_data without its time, for the date filter.
         
         Args:
             covid_data: A covid data object object.
         Returns:
-            [datetime.datetime]: Converted time to datetime object.
+            [datetime.date]: The date of the covid data object.
             
         """
-        return covid_data.date.date()
+        return covid_data.date_only
 
 class StateFilter(AttributeFilter):
     """Subclass of AttributeFilter to filter covid data objects by State."""
 
+    field = 'state'
+    selectivity_hint = 0.02
+
     @classmethod
     def get(cls, covid_data):
         """Return the State abbreviation of the covid data  object for the State filter.
@@ -104,6 +191,8 @@ class StateFilter(AttributeFilter):
 class HospitalizedFilter(AttributeFilter):
     """Subclass of AttributeFilter to filter covid data objects by number of hospitalizedCurrently."""
 
+    field = 'hospitalizedCurrently'
+
     @classmethod
     def get(cls, covid_data):
         """Return covid_data.hospitalizedCurrently for the Hospitalized filter.
@@ -119,6 +208,8 @@ class HospitalizedFilter(AttributeFilter):
 class IcuFilter(AttributeFilter):
     """Subclass of AttributeFilter to filter covid data objects by number of inIcuCurrently."""
 
+    field = 'inIcuCurrently'
+
     @classmethod
     def get(cls, covid_data):
         """Return covid_data.inIcuCurrently for the Icu filter.
@@ -134,6 +225,8 @@ class IcuFilter(AttributeFilter):
 class OnVentFilter(AttributeFilter):
     """Subclass to filter covid data objects by number of onVentilatorCurrently."""
 
+    field = 'onVentilatorCurrently'
+
     @classmethod
     def get(cls, covid_data):
         """Return covid_data.onVentilatorCurrently for the Icu filter.
@@ -149,6 +242,8 @@ class OnVentFilter(AttributeFilter):
 class DeathFilter(AttributeFilter):
     """Subclass to filter covid data objects by number of deaths."""
 
+    field = 'death'
+
     @classmethod
     def get(cls, covid_data):
         """Return the covid_data.death for the death filter.
@@ -181,7 +276,7 @@ def create_filters(date=None, start_date=None, end_date=None,
     :param onvent_max: A maximum number of people on ventilator of a matching `covid data object`.
     :param death_min: A minimum number of deaths of a matching `covid data object`.
     :param death_max: A maximum number of deaths of a matching `covid data object`.
-    :return: A collection of filters for use with `query`.
+    :return: A collection of filters for use with `query`, most selective first.
     """
     filters = []
     
@@ -214,9 +309,82 @@ def create_filters(date=None, start_date=None, end_date=None,
     if death_max:
         filters.append(DeathFilter(operator.le, death_max))
 
+    filters.sort(key=operator.attrgetter('selectivity_hint'))
     return filters
 
 
+# Infix spelling of the comparators that `compile_filters` can inline.
+_OPERATOR_SYMBOLS = {
+    operator.eq: '==',
+    operator.ne: '!=',
+    operator.lt: '<',
+    operator.le: '<=',
+    operator.gt: '>',
+    operator.ge: '>=',
+}
+
+# Kernels generated by `compile_filters`, keyed by the query shape: the field
+# and comparator of each filter, in order.
+_kernels = {}
+
+
+def _build_kernel(signature):
+    """Generate the source of a kernel for a query shape and compile it.
+
+    For example, the shape `(('state', operator.eq), ('death', operator.ge))`
+    produces::
+
+        def kernel(rows, c0, v0, c1, v1):
+            return (row for row in rows if c0[row] == v0 and c1[row] >= v1)
+
+    :param signature: A tuple of `(field, op)` pairs, one per filter.
+    :return: The kernel function.
+    """
+    params = ', '.join(f'c{i}, v{i}' for i in range(len(signature)))
+    condition = ' and '.join(f'c{i}[row] {_OPERATOR_SYMBOLS[op]} v{i}'
+                             for i, (_, op) in enumerate(signature))
+    source = (f'def kernel(rows, {params}):\n'
+              f'    return (row for row in rows if {condition})\n')
+    namespace = {}
+    exec(compile(source, '<compile_filters>', 'exec'), namespace)
+    return namespace['kernel']
+
+
+def compile_filters(filters):
+    """Compile a collection of filters into one function over database columns.
+
+    The generated kernel inlines every comparison into a single generator over
+    the rows, with the filters' `and` short-circuiting in order, instead of
+    dispatching through `op` and `get` for each filter and row. Kernels are
+    cached by query shape, so a query re-run with other reference values reuses
+    the same kernel.
+
+    Only filters that `compares_column` can be compiled.
+
+    :param filters: A collection of filters capturing user-specified criteria.
+    :return: A function `select(db, rows)` returning a lazy iterator of the positions
+        in `rows` whose objects of `db` match all the filters, or None if a filter
+        can't be compiled.
+    """
+    filters = tuple(filters)
+    for f in filters:
+        if not f.compares_column():
+            return None
+
+    signature = tuple((f.field, f.op) for f in filters)
+    kernel = _kernels.get(signature)
+    if kernel is None:
+        kernel = _kernels[signature] = _build_kernel(signature)
+
+    def select(db, rows):
+        args = []
+        for f in filters:
+            args += (db.column(f.field), f.value)
+        return kernel(rows, *args)
+
+    return select
+
+
 def limit(iterator, n=None):
     """Produce a limited stream of values from an iterator.
 
@@ -228,4 +396,4 @@ def limit(iterator, n=None):
     """
     if n == 0 or n is None:
         return iterator
-    return [x for i, x in enumerate(iterator) if i < n]
+    return islice(iterator, n)
@@ -1,8 +1,12 @@
 import datetime
+import functools
 
 
+@functools.lru_cache(maxsize=None)
 def cd_to_datetime(calendar_date):
     """
+    Results are cached, since the same few hundred dates recur for every state.
+
     :param calendar_date: A calendar date in YYYY-mm-DD format.
     :return: A `datetime` corresponding to the given calendar date and time.
     """
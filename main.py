@@ -28,7 +28,7 @@ import pathlib
 import sys
 import time
 
-from extract import load_cdc_data
+from extract import iter_cdc_data
 from database import CDCTrackingDatabase
 from filters import create_filters, limit
 
@@ -150,8 +150,8 @@ def inspect(database, date=None, state=None):
         print("No matching CDC tracking data exist in the database.", file=sys.stderr)
         return None
 
-    for _, d in enumerate(covidData):
-       print(d)
+    # Write all the matches with one call rather than one `print` each.
+    sys.stdout.writelines(map('{}\n'.format, covidData))
 
     return covidData
 
@@ -180,8 +180,7 @@ def query(database, args):
     results = database.query(filters)
 
     # Write the results to stdout, limiting to 50 entries if not specified.
-    for result in limit(results, args.limit or 50):
-        print(result)
+    sys.stdout.writelines(map('{}\n'.format, limit(results, args.limit or 50)))
 
 def main():
     """Run the main script."""
@@ -189,7 +188,7 @@ def main():
     args = parser.parse_args()
 
     # Extract data from the data files into structured Python objects.
-    database = CDCTrackingDatabase(load_cdc_data(args.datafile))
+    database = CDCTrackingDatabase(iter_cdc_data(args.datafile))
 
     # Run the chosen subcommand.
     if args.cmd == 'inspect':
@@ -1,42 +1,67 @@
-from helpers import cd_to_datetime, datetime_to_str
+from helpers import cd_to_datetime
 import datetime
+import sys
 
 class CDCTrackingObject:
     """A CDCTrackingObject
     A CDCTrackingObject corresponds to a row of the CSV data with a subset of columns of interest.
     """
 
-    def __init__(self, **info):
+    # One object is built per CSV row, so store attributes in slots rather
+    # than in a per-instance `__dict__`.
+    __slots__ = (
+        "date_str",
+        "date",
+        "date_only",
+        "state",
+        "death",
+        "deathIncrease",
+        "hospitalizedCumulative",
+        "hospitalizedCurrently",
+        "inIcuCurrently",
+        "negative",
+        "onVentilatorCumulative",
+        "onVentilatorCurrently",
+        "positive",
+        "totalTestResultsIncrease",
+        "totalTestsAntibody",
+        "totalTestsAntigen",
+        "totalTestsViral",
+    )
+
+    def __init__(self, date, state, death, deathIncrease,
+                 hospitalizedCumulative, hospitalizedCurrently, inIcuCurrently,
+                 negative, onVentilatorCumulative, onVentilatorCurrently, positive,
+                 totalTestResultsIncrease, totalTestsAntibody, totalTestsAntigen,
+                 totalTestsViral):
         """Create a new `CDCTrackingObject`.
-        :param info: A dictionary of excess keyword arguments supplied to the constructor.
-        """
-        self.date = cd_to_datetime(info.get("date"))
-        self.state = info.get("state")
-        self.death = info.get("death")
-        self.deathIncrease = info.get("deathIncrease")
-        self.hospitalizedCumulative = info.get("hospitalizedCumulative")
-        self.hospitalizedCurrently = info.get("hospitalizedCurrently")
-        self.inIcuCurrently = info.get("inIcuCurrently")
-        self.negative = info.get("negative")
-        self.onVentilatorCumulative = info.get("onVentilatorCumulative")
-        self.onVentilatorCurrently = info.get("onVentilatorCurrently")
-        self.positive = info.get("positive")
-        self.totalTestResultsIncrease = info.get("totalTestResultsIncrease")
-        self.totalTestsAntibody = info.get("totalTestsAntibody")
-        self.totalTestsAntigen = info.get("totalTestsAntigen")
-        self.totalTestsViral = info.get("totalTestsViral")
 
-    @property
-    def date_str(self):
-        """Return a formatted representation of date.
+        The parameters follow the order of `extract.FIELDS`, so that a parsed row
+        can be passed positionally.
 
-        The `datetime_to_str` method converts a `datetime` object to a
-        formatted string that can be used in human-readable representations and
-        in serialization to CSV and JSON files.
+        :param date: The calendar date of the data, in YYYY-mm-DD format.
+        :param state: The abbreviation of the US state the data is collected in.
+        The remaining parameters are the counts of the columns of the same names.
         """
-        if self.date:
-            return datetime_to_str(self.date)
-        return "an unknown time"
+        self.date_str = date
+        self.date = cd_to_datetime(date)
+        self.date_only = self.date.date()
+        # A few dozen state abbreviations repeat across every date; interning
+        # shares one string per state and lets equal states compare by identity.
+        self.state = sys.intern(state)
+        self.death = death
+        self.deathIncrease = deathIncrease
+        self.hospitalizedCumulative = hospitalizedCumulative
+        self.hospitalizedCurrently = hospitalizedCurrently
+        self.inIcuCurrently = inIcuCurrently
+        self.negative = negative
+        self.onVentilatorCumulative = onVentilatorCumulative
+        self.onVentilatorCurrently = onVentilatorCurrently
+        self.positive = positive
+        self.totalTestResultsIncrease = totalTestResultsIncrease
+        self.totalTestsAntibody = totalTestsAntibody
+        self.totalTestsAntigen = totalTestsAntigen
+        self.totalTestsViral = totalTestsViral
 
     def __str__(self):
         return '\n'.join((f"On {self.date_str}, state {self.state} has {self.death} deaths. The total number of people currently hospitalized is {self.hospitalizedCurrently}.",
@@ -0,0 +1,46 @@
+"""Provide the test data shared by the test modules.
+
+`load_fixture` reads a test CSV file, builds a `CDCTrackingDatabase` from it and
+indexes its objects by date and by state. The result is memoized per path, so
+however many test classes use the same file, it is only loaded once per process.
+
+"""
+import collections
+import functools
+import itertools
+import operator
+import pathlib
+
+from database import CDCTrackingDatabase
+from extract import load_cdc_data
+from helpers import datetime_to_str
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_COVID_FILE = TESTS_ROOT / 'test-covid-2021-states-covid-history.csv'
+
+Fixture = collections.namedtuple('Fixture', ['cdc_objs', 'db', 'by_date', 'by_state'])
+
+
+@functools.lru_cache(maxsize=None)
+def load_fixture(path=TEST_COVID_FILE):
+    """Load the test data of a CSV file.
+
+    :param path: A path to a CSV file containing cdc tracking data.
+    :return: A `Fixture` of the loaded objects, a database of them, and the
+        objects grouped by date string and by state.
+    """
+    cdc_objs = load_cdc_data(path)
+    by_date = collections.defaultdict(list)
+    by_state = collections.defaultdict(list)
+    # The CSV rows of a date are contiguous, so group runs of equal dates and
+    # format each distinct date once, rather than once per object.
+    date_strs = {}
+    for date, group in itertools.groupby(cdc_objs, key=operator.attrgetter('date')):
+       date_str = date_strs.get(date)
+       if date_str is None:
+          date_str = date_strs[date] = datetime_to_str(date)
+       by_date[date_str].extend(group)
+    for d in cdc_objs:
+       by_state[d.state].append(d)
+    return Fixture(cdc_objs, CDCTrackingDatabase(cdc_objs), by_date, by_state)
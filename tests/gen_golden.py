@@ -0,0 +1,28 @@
+"""Regenerate the expected results frozen for the query tests.
+
+`tests/test_query.py` reads the expected results of its queries from
+`tests/expected_results.json`, as long as that file was generated from the
+current test CSV file. After changing the test CSV file or the criteria of the
+tests, regenerate it from the project root with::
+
+    $ python3 -m tests.gen_golden
+
+"""
+import unittest
+
+from tests import test_query
+
+
+def main():
+    """Run the query tests, recording every expected result they compute."""
+    test_query._RECORDING = {}
+    suite = unittest.defaultTestLoader.loadTestsFromModule(test_query)
+    result = unittest.TextTestRunner(verbosity=1).run(suite)
+    if not result.wasSuccessful():
+        raise SystemExit("Not freezing expected results of failing tests.")
+    test_query.dump_golden(test_query._RECORDING)
+    print(f"Froze {len(test_query._RECORDING)} expected results in {test_query.GOLDEN_FILE}.")
+
+
+if __name__ == '__main__':
+    main()
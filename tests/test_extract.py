@@ -10,27 +10,28 @@ To run these tests from the project root, run:
 """
 import collections.abc
 import datetime
-import pathlib
+import json
 import math
+import os
+import pathlib
+import pickle
+import sys
+import tempfile
 import unittest
 
-from extract import load_cdc_data
+from extract import (FIELDS, iter_cached_cdc_rows, iter_cached_rows, load_cached_cdc_rows, load_cdc_data,
+                     read_cdc_rows, source_of)
 from models import CDCTrackingObject
-from helpers import datetime_to_str
-from collections import defaultdict
 
-TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
-TEST_COVID_FILE = TESTS_ROOT / 'test-covid-2021-states-covid-history.csv'
+from tests.fixtures import TEST_COVID_FILE, load_fixture
 
 class TestLoadCdcObjs(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.cdc_objs = load_cdc_data(TEST_COVID_FILE)
-        cls.cdc_data_by_state = defaultdict(list)
-        cls.cdc_data_by_date = defaultdict(list)
-        for d in cls.cdc_objs:
-           cls.cdc_data_by_date[datetime_to_str(d.date)].append(d)
-           cls.cdc_data_by_state[d.state].append(d)
+        fixture = load_fixture(TEST_COVID_FILE)
+        cls.cdc_objs = fixture.cdc_objs
+        cls.cdc_data_by_state = fixture.by_state
+        cls.cdc_data_by_date = fixture.by_date
 
     @classmethod
     def get_first_cdc_obj_or_none(cls):
@@ -68,6 +69,172 @@ class TestLoadCdcObjs(unittest.TestCase):
                wisc = d
         self.assertEqual(wisc.death, 7014)
 
+    def test_cdc_data_share_state_strings(self):
+        # States are interned on load, so equal states are one string object.
+        data_ca = self.cdc_data_by_state['CA']
+        self.assertGreater(len(data_ca), 1)
+        for d in data_ca:
+            self.assertIs(d.state, data_ca[0].state)
+        self.assertIs(data_ca[0].state, sys.intern('CA'))
+
+
+class TestLoadCdcObjsFromIrregularCsv(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.csv_path = pathlib.Path(tmpdir.name) / 'covid.csv'
+        with open(TEST_COVID_FILE) as infile:
+            self.lines = [next(infile) for _ in range(3)]
+
+    def write_csv(self, lines):
+        with open(self.csv_path, 'w') as outfile:
+            outfile.writelines(lines)
+
+    def test_blank_lines_are_skipped(self):
+        self.write_csv([*self.lines, '\n'])
+        cdc_objs = load_cdc_data(self.csv_path)
+        self.assertEqual(len(cdc_objs), 2)
+        self.assertEqual([d.state for d in cdc_objs], ['AK', 'AL'])
+
+    def test_missing_cells_are_read_as_zero(self):
+        header, first, second = self.lines
+        # Keep the date, state and death cells of the first row only.
+        short = ','.join(first.split(',')[:3]) + '\n'
+        self.write_csv([header, short, second])
+        cdc_objs = load_cdc_data(self.csv_path)
+        self.assertEqual(len(cdc_objs), 2)
+        self.assertEqual(cdc_objs[0].death, 305)
+        self.assertEqual(cdc_objs[0].hospitalizedCurrently, 0)
+        self.assertEqual(cdc_objs[0].totalTestsViral, 0)
+        self.assertEqual(cdc_objs[1].death, 10148)
+
+
+class TestCdcRowsCache(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = pathlib.Path(tmpdir.name)
+        with open(TEST_COVID_FILE) as infile:
+            self.lines = [next(infile) for _ in range(5)]
+        self.csv_path = self.write_csv('covid.csv', self.lines[:3])
+        self.cache_path = self.tmpdir / 'covid.csv.cache.json'
+        self.rows = read_cdc_rows(self.csv_path)
+
+    def write_csv(self, name, lines, mtime=None):
+        path = self.tmpdir / name
+        with open(path, 'w') as outfile:
+            outfile.writelines(lines)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def write_cache(self, rows, source=None, fields=FIELDS, trailer=None):
+        """Write a cache of rows, by default for the current CSV file."""
+        if source is None:
+            source = source_of(self.csv_path)
+        if trailer is None:
+            trailer = {'rows': len(rows)}
+        lines = [{'source': source, 'fields': fields}, *rows, trailer]
+        self.cache_path.write_text(''.join(json.dumps(line) + '\n' for line in lines))
+
+    def rows_with_death(self, death):
+        rows = [list(row) for row in self.rows]
+        rows[0][FIELDS.index('death')] = death
+        return rows
+
+    def test_cache_is_written_and_used(self):
+        self.assertEqual(load_cached_cdc_rows(self.csv_path), self.rows)
+        self.assertEqual(list(iter_cached_rows(self.cache_path, source_of(self.csv_path))), self.rows)
+
+        self.write_cache(self.rows_with_death(1))
+        self.assertEqual(load_cached_cdc_rows(self.csv_path)[0][FIELDS.index('death')], 1)
+
+    def test_cache_of_other_csv_version_is_ignored(self):
+        source = source_of(self.csv_path)
+        for changed in ('size', 'mtime_ns'):
+            with self.subTest(changed=changed):
+                self.write_cache(self.rows_with_death(1), source={**source, changed: source[changed] - 1})
+                self.assertEqual(load_cached_cdc_rows(self.csv_path), self.rows)
+                # The cache is rewritten from the CSV file.
+                self.assertEqual(list(iter_cached_rows(self.cache_path, source)), self.rows)
+
+    def test_cache_of_csv_replaced_by_older_file_is_ignored(self):
+        load_cached_cdc_rows(self.csv_path)
+        # Like `cp -p` or `tar x`, replace the CSV file keeping an older mtime.
+        old = self.csv_path.stat().st_mtime - 60
+        self.write_csv('covid.csv', [self.lines[0], *self.lines[3:]], mtime=old)
+        rows = load_cached_cdc_rows(self.csv_path)
+        self.assertEqual(rows, read_cdc_rows(self.csv_path))
+        self.assertEqual([row[1] for row in rows], ['AR', 'AS'])
+
+    def test_sibling_files_have_their_own_caches(self):
+        load_cached_cdc_rows(self.csv_path)
+        old = self.csv_path.stat().st_mtime - 60
+        txt_path = self.write_csv('covid.txt', [self.lines[0], *self.lines[3:]], mtime=old)
+        rows = load_cached_cdc_rows(txt_path)
+        self.assertEqual([row[1] for row in rows], ['AR', 'AS'])
+        self.assertEqual(load_cached_cdc_rows(self.csv_path), self.rows)
+
+    def test_cache_for_other_fields_is_ignored(self):
+        self.write_cache(self.rows_with_death(1), fields=FIELDS[:-1])
+        self.assertEqual(load_cached_cdc_rows(self.csv_path), self.rows)
+
+    def test_corrupt_cache_is_ignored(self):
+        header = json.dumps({'source': source_of(self.csv_path), 'fields': FIELDS}) + '\n'
+        rows = ''.join(json.dumps(row) + '\n' for row in self.rows)
+        corrupt = [
+            '',
+            '{"fields": [',
+            '5\n',
+            header,
+            header + '5\n',
+            header + '["2021-03-07", "AK"]\n',
+            header + json.dumps(self.rows_with_death('305')[0]) + '\n',
+            rows,
+            header + rows,
+            header + rows + '{"rows": 3}\n',
+            header + rows + '{"rows": 2}\n' + rows,
+        ]
+        for content in corrupt:
+            with self.subTest(content=content[-60:]):
+                self.cache_path.write_text(content)
+                self.assertEqual(load_cached_cdc_rows(self.csv_path), self.rows)
+        with self.subTest(content='pickle'):
+            self.cache_path.write_bytes(pickle.dumps((FIELDS, self.rows)))
+            self.assertEqual(load_cached_cdc_rows(self.csv_path), self.rows)
+
+    def test_cache_found_bad_midway_is_completed_from_csv(self):
+        rows = self.rows_with_death(1)
+        rows[1] = ['bad']
+        self.write_cache(rows)
+        received = load_cached_cdc_rows(self.csv_path)
+        # The first row came from the cache before the bad one was reached.
+        self.assertEqual(received[0][FIELDS.index('death')], 1)
+        self.assertEqual(received[1:], self.rows[1:])
+        self.assertEqual(list(iter_cached_rows(self.cache_path, source_of(self.csv_path))), self.rows)
+
+    def test_cache_is_only_written_once_all_rows_are_read(self):
+        rows = iter_cached_cdc_rows(self.csv_path)
+        self.assertEqual(next(rows), self.rows[0])
+        rows.close()
+        self.assertEqual(list(self.tmpdir.iterdir()), [self.csv_path])
+
+    def test_unwritable_cache_is_skipped(self):
+        with self.subTest('read-only directory'):
+            self.tmpdir.chmod(0o555)
+            try:
+                if os.access(self.tmpdir, os.W_OK):
+                    self.skipTest("Directory permissions are not enforced for this user.")
+                self.assertEqual(load_cached_cdc_rows(self.csv_path), self.rows)
+                self.assertFalse(self.cache_path.exists())
+            finally:
+                self.tmpdir.chmod(0o755)
+        with self.subTest('cache path taken by a directory'):
+            self.cache_path.mkdir()
+            self.assertEqual(load_cached_cdc_rows(self.csv_path), self.rows)
+            # The temporary cache that couldn't be put in place is removed.
+            self.assertEqual(sorted(self.tmpdir.iterdir()), [self.csv_path, self.cache_path])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -11,326 +11,399 @@ To run these tests from the project root, run::
     $ python3 -m unittest --verbose tests.test_query
 
 """
+import bisect
 import datetime
+import functools
+import hashlib
+import itertools
+import json
+import operator
 import pathlib
+import pickle
+import tempfile
 import unittest
 
 from database import CDCTrackingDatabase
-from extract import load_cdc_data
-from filters import create_filters
-from collections import defaultdict
-from helpers import cd_to_datetime, datetime_to_str
+from filters import AttributeFilter, DateFilter, HospitalizedFilter, StateFilter, create_filters, limit
 
+from tests.fixtures import TESTS_ROOT, TEST_COVID_FILE, load_fixture
 
-TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
-TEST_COVID_FILE = TESTS_ROOT / 'test-covid-2021-states-covid-history.csv'
 
+@functools.lru_cache(maxsize=None)
+def _create_filters_from_items(items):
+    return tuple(create_filters(**dict(items)))
 
-class TestQuery(unittest.TestCase):
-
-    @classmethod
-    def setUpClass(cls):
-        cls.cdc_objs = load_cdc_data(TEST_COVID_FILE)
-        cls.db = CDCTrackingDatabase(cls.cdc_objs)
-        cls.cdc_data_by_state = defaultdict(list)
-        cls.cdc_data_by_date = defaultdict(list)
-        for d in cls.cdc_objs:
-           cls.cdc_data_by_date[datetime_to_str(d.date)].append(d)
-           cls.cdc_data_by_state[d.state].append(d)
-
-    def test_query_all(self):
-        expected = list(self.cdc_objs)
-        self.assertGreater(len(expected), 0)
-
-        filters = create_filters()
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    ###############################################
-    # Single filters and pairs of related filters #
-    ###############################################
-
-    def test_query_data_on_feb_1(self):
-        date = datetime.date(2021, 2, 1)
-
-        expected = self.cdc_data_by_date['2021-02-01']
-        self.assertGreater(len(expected), 0)
-
-        filters = create_filters(date=date)
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_data_after_feb_1_2021(self):
-        start_date = cd_to_datetime('2021-02-01').date()
-        s_date = datetime.datetime(2021, 2, 1)
-
-        expected = []
-        for d in self.cdc_objs:
-           if d.date >= s_date:
-              expected.append(d)
-        self.assertGreater(len(expected), 0)
-
-        filters = create_filters(start_date=start_date)
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_data_before_mar_3_2021(self):
-        end_date = cd_to_datetime('2021-03-03').date()
-        e_date = datetime.datetime(2021, 3, 3)
-
-        expected = []
-        for d in self.cdc_objs:
-           if d.date <= e_date:
-              expected.append(d)
-        self.assertGreater(len(expected), 0)
-
-        filters = create_filters(end_date=end_date)
-        received = list(self.db.query(filters))
-    
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_with_conflicting_date_bounds(self):
-        start_date = datetime.date(2020, 10, 1)
-        end_date = datetime.date(2020, 4, 1)
-
-        expected = list()
-
-        filters = create_filters(start_date=start_date, end_date=end_date)
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_with_bounds_and_a_specific_date(self):
-        start_date = datetime.date(2021, 2, 1)
-        date = datetime.date(2021, 2, 14)
-        end_date = datetime.date(2021, 3, 1)
-        specific_date = datetime.datetime(2021, 2, 14)
-
-        expected = []
-        for d in self.cdc_objs:
-           if d.date == specific_date:
-              expected.append(d)
-        self.assertGreater(len(expected), 0)
 
-        filters = create_filters(date=date, start_date=start_date, end_date=end_date)
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+def _create_filters(**kwargs):
+    """Return the filters of `create_filters(**kwargs)`, built once per distinct arguments."""
+    return _create_filters_from_items(tuple(sorted(kwargs.items())))
 
-    def test_query_data_min_hospitalized(self):
-        hospitalized_min = 100
-
-        expected = []
-        for d in self.cdc_objs:
-           if d.hospitalizedCurrently >= hospitalized_min:
-              expected.append(d)
-        self.assertGreater(len(expected), 0)
-
-        filters = create_filters(hospitalized_min=hospitalized_min)
-        received = list(self.db.query(filters))
-
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_data_max_hospitalized(self):
-        hospitalized_max = 2000
-
-        expected = []
-        for d in self.cdc_objs:
-           if d.hospitalizedCurrently <= hospitalized_max:
-              expected.append(d)
-        self.assertGreater(len(expected), 0)
-
-        filters = create_filters(hospitalized_max=hospitalized_max)
-        received = list(self.db.query(filters))
 
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_with_max_hospitalized_and_min_hospitalized(self):
-        hospitalized_max = 2000
-        hospitalized_min = 100
+class HospitalizedPlusIcuFilter(HospitalizedFilter):
+    """A filter inheriting `field` but overriding `get` to read something else."""
 
-        expected = []
-        for d in self.cdc_objs:
-           if hospitalized_min <= d.hospitalizedCurrently <= hospitalized_max:
-              expected.append(d)
-        self.assertGreater(len(expected), 0)
+    @classmethod
+    def get(cls, covid_data):
+        return covid_data.hospitalizedCurrently + covid_data.inIcuCurrently
 
-        filters = create_filters(hospitalized_min=hospitalized_min, hospitalized_max=hospitalized_max)
-        received = list(self.db.query(filters))
 
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+class LowerCaseStateFilter(StateFilter):
+    """A filter inheriting `field` but overriding `__call__` to compare something else."""
 
-    def test_query_with_max_hospitalized_and_min_hospitalized_conflicting(self):
-        hospitalized_max = 100
-        hospitalized_min = 4000
+    def __call__(self, covid_data):
+        return self.op(covid_data.state.lower(), self.value)
 
-        expected = list()
 
-        filters = create_filters(hospitalized_min=hospitalized_min, hospitalized_max=hospitalized_max)
-        received = list(self.db.query(filters))
-
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+class DayOfMonthFilter(DateFilter):
+    """A date filter overriding `get`, which the date index can't answer."""
 
+    @classmethod
+    def get(cls, covid_data):
+        return covid_data.date.day
+
+
+class NextDayFilter(DateFilter):
+    """A date filter overriding `values` to compare the day after each date."""
+
+    def values(self, db, rows=None):
+        return (date + datetime.timedelta(days=1) for date in super().values(db, rows))
+
+
+# Dates the tests query on.
+APR_1_2020 = datetime.date(2020, 4, 1)
+OCT_1_2020 = datetime.date(2020, 10, 1)
+JAN_1_2021 = datetime.date(2021, 1, 1)
+JAN_31_2021 = datetime.date(2021, 1, 31)
+FEB_1_2021 = datetime.date(2021, 2, 1)
+FEB_2_2021 = datetime.date(2021, 2, 2)
+FEB_14_2021 = datetime.date(2021, 2, 14)
+MAR_1_2021 = datetime.date(2021, 3, 1)
+MAR_2_2021 = datetime.date(2021, 3, 2)
+MAR_3_2021 = datetime.date(2021, 3, 3)
+MAR_31_2021 = datetime.date(2021, 3, 31)
+
+# The criteria of `create_filters`, as the test column and comparator each checks.
+_CRITERIA = {
+    'date': ('date', operator.eq),
+    'start_date': ('date', operator.ge),
+    'end_date': ('date', operator.le),
+    'state': ('state', operator.eq),
+    'hospitalized_min': ('hospitalizedCurrently', operator.ge),
+    'hospitalized_max': ('hospitalizedCurrently', operator.le),
+    'icu_min': ('inIcuCurrently', operator.ge),
+    'icu_max': ('inIcuCurrently', operator.le),
+    'onvent_min': ('onVentilatorCurrently', operator.ge),
+    'onvent_max': ('onVentilatorCurrently', operator.le),
+    'death_min': ('death', operator.ge),
+    'death_max': ('death', operator.le),
+}
+
+# Expected results frozen by `tests/gen_golden.py`, for `TEST_COVID_FILE`.
+GOLDEN_FILE = TESTS_ROOT / 'expected_results.json'
+
+
+def _criteria_key(criteria):
+    """Return the key of some criteria in `GOLDEN_FILE`, e.g. 'death_max=2000,state=CA'."""
+    return ','.join(f'{name}={value}' for name, value in sorted(criteria.items()))
+
+
+def _encode_mask(mask):
+    """Encode a sequence of booleans as a hexadecimal bitmask, first element in the lowest bit."""
+    return format(int(''.join('1' if b else '0' for b in reversed(mask)) or '0', 2), 'x')
+
+
+def _decode_mask(bitmask, length):
+    """Decode a hexadecimal bitmask from `_encode_mask` into `length` booleans."""
+    return map('1'.__eq__, reversed(format(int(bitmask, 16), f'0{length}b')))
+
+
+def _source_digest():
+    """Return the SHA-256 digest of `TEST_COVID_FILE`, to tell when `GOLDEN_FILE` is stale."""
+    return hashlib.sha256(TEST_COVID_FILE.read_bytes()).hexdigest()
+
+
+def load_golden(path=GOLDEN_FILE):
+    """Return the frozen expected results, or an empty dict if they are missing or stale.
+
+    A malformed file, such as one left with merge conflicts, counts as stale, so
+    that the tests compute their expected results instead.
+    """
+    try:
+        with open(path) as infile:
+            golden = json.load(infile)
+        if golden['source_sha256'] != _source_digest():
+            return {}
+        results = golden['results']
+    except (FileNotFoundError, ValueError, KeyError, TypeError):
+        return {}
+    if not isinstance(results, dict):
+        return {}
+    return results
+
+
+def dump_golden(results):
+    """Freeze expected results recorded by `_expected` into `GOLDEN_FILE`."""
+    with open(GOLDEN_FILE, 'w') as outfile:
+        json.dump({'source_sha256': _source_digest(), 'results': results},
+                  outfile, indent=2, sort_keys=True)
+        outfile.write('\n')
+
+
+# Expected results recorded while computing them, when regenerating `GOLDEN_FILE`.
+_RECORDING = None
+_GOLDEN = {}
+_FIXTURE = None
+_COLUMNS = None
+_DATE_ORDER = None
+_SORTED_DATES = None
+
+
+def setUpModule():
+    """Load the test data and build its columns once for every test class of this module."""
+    global _GOLDEN, _FIXTURE, _COLUMNS, _DATE_ORDER, _SORTED_DATES
+    _GOLDEN = load_golden()
+    _FIXTURE = load_fixture(TEST_COVID_FILE)
+    cdc_objs = _FIXTURE.cdc_objs
+    # Column-wise copies of the attributes that tests filter on, to compute
+    # expected results without going through `query`.
+    _COLUMNS = {
+        'date': tuple(d.date.date() for d in cdc_objs),
+        'state': tuple(d.state for d in cdc_objs),
+        'hospitalizedCurrently': tuple(d.hospitalizedCurrently for d in cdc_objs),
+        'inIcuCurrently': tuple(d.inIcuCurrently for d in cdc_objs),
+        'onVentilatorCurrently': tuple(d.onVentilatorCurrently for d in cdc_objs),
+        'death': tuple(d.death for d in cdc_objs),
+    }
+    # Positions of the objects sorted by date, and their dates, to find the
+    # objects within date bounds by binary search.
+    dates = _COLUMNS['date']
+    _DATE_ORDER = sorted(range(len(dates)), key=dates.__getitem__)
+    _SORTED_DATES = [dates[i] for i in _DATE_ORDER]
 
-    def test_query_data_min_icu(self):
-        icu_min = 200
 
-        expected = []
-        for d in self.cdc_objs:
-           if d.inIcuCurrently >= icu_min:
-              expected.append(d)
-        self.assertGreater(len(expected), 0)
+class TestQuery(unittest.TestCase):
 
-        filters = create_filters(icu_min=icu_min)
-        received = list(self.db.query(filters))
+    @classmethod
+    def setUpClass(cls):
+        cls.cdc_objs = _FIXTURE.cdc_objs
+        cls.db = _FIXTURE.db
+        cls.cdc_data_by_state = _FIXTURE.by_state
+        cls.cdc_data_by_date = _FIXTURE.by_date
+        cls._columns = _COLUMNS
+        cls._date_order = _DATE_ORDER
+        cls._sorted_dates = _SORTED_DATES
 
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+    @classmethod
+    def _expected_in_date_range(cls, start_date=None, end_date=None):
+        """Return the test objects dated within the given bounds, in file order."""
+        lo = 0 if start_date is None else bisect.bisect_left(cls._sorted_dates, start_date)
+        hi = len(cls._sorted_dates) if end_date is None else bisect.bisect_right(cls._sorted_dates, end_date)
+        return [cls.cdc_objs[i] for i in sorted(cls._date_order[lo:hi])]
 
-    def test_query_with_max_icu(self):
-        icu_max = 4000
+    @classmethod
+    def _expected(cls, **criteria):
+        """Return the test objects matching all the given criteria, in file order.
+
+        The arguments are those of `create_filters`. Results frozen in
+        `GOLDEN_FILE` are used when available. Otherwise each criterion is
+        checked over a whole column, and the objects passing all of them are kept.
+        """
+        criteria = {name: value for name, value in criteria.items() if value is not None}
+        key = _criteria_key(criteria)
+        if _RECORDING is None and key in _GOLDEN:
+            return list(itertools.compress(cls.cdc_objs, _decode_mask(_GOLDEN[key], len(cls.cdc_objs))))
+
+        masks = []
+        for name, value in criteria.items():
+            column, op = _CRITERIA[name]
+            masks.append(map(op, cls._columns[column], itertools.repeat(value)))
+        if not masks:
+            return list(cls.cdc_objs)
+        mask = list(map(all, zip(*masks)))
+        if _RECORDING is not None:
+            _RECORDING[key] = _encode_mask(mask)
+        return list(itertools.compress(cls.cdc_objs, mask))
+
+    def _assert_query_equal(self, expected, filters):
+        """Assert that querying the test database with `filters` yields `expected`, in order.
+
+        The query results are compared as they stream out, so they are never
+        collected into a list, and the first mismatch fails the test. Identical
+        objects are accepted before any comparison, so passing tests never go
+        through `assertEqual`'s diffing of long lists.
+        """
+        missing = object()
+        pairs = itertools.zip_longest(expected, self.db.query(filters), fillvalue=missing)
+        for index, (e, r) in enumerate(pairs):
+            if e is missing:
+                self.fail(f"Computed results have extra results from index {index}: {r!r}.")
+            if r is missing:
+                self.fail(f"Computed results are missing results from index {index}: {e!r}.")
+            if e is not r and e != r:
+                self.fail(f"Computed results do not match expected results at index {index}: "
+                          f"expected {e!r}, received {r!r}.")
 
-        expected = []
-        for d in self.cdc_objs:
-           if d.inIcuCurrently <= icu_max:
-              expected.append(d)
+    def test_query_all(self):
+        expected = self.cdc_objs
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(icu_max=icu_max)
-        received = list(self.db.query(filters))
-
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_with_max_icu_and_min_icu(self):
-        icu_min = 100
-        icu_max = 3000
+        filters = _create_filters()
+        self._assert_query_equal(expected, filters)
 
-        expected = []
-        for d in self.cdc_objs:
-           if icu_min <= d.inIcuCurrently <= icu_max:
-              expected.append(d)
+    def test_database_pickles(self):
+        filters = _create_filters(start_date=FEB_1_2021, state='CA')
+        expected = list(map(repr, self.db.query(filters)))
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(icu_min=icu_min, icu_max=icu_max)
-        received = list(self.db.query(filters))
-
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_with_max_icu_and_min_icu_conflicting(self):
-        icu_max = 100
-        icu_min = 4000
+        # Unpickled objects are copies, so compare their representations.
+        db = pickle.loads(pickle.dumps(self.db))
+        self.assertEqual(len(self.db), len(db))
+        self.assertEqual(expected, list(map(repr, db.query(filters))))
 
-        expected = list()
-
-        filters = create_filters(icu_min=icu_min, icu_max=icu_max)
-        received = list(self.db.query(filters))
+    def test_column_matches_tracking_data(self):
+        expected = tuple(d.death for d in self.cdc_objs)
+        self.assertEqual(len(self.db), len(self.cdc_objs))
+        self.assertEqual(expected, self.db.column('death'))
 
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+    ###############################################
+    # Single filters and pairs of related filters #
+    ###############################################
 
-    def test_query_with_min_onvent(self):
-        onvent_min = 500
+    def test_query_data_on_feb_1(self):
+        date = FEB_1_2021
 
-        expected = []
-        for d in self.cdc_objs:
-           if d.onVentilatorCurrently >= onvent_min:
-              expected.append(d)
+        expected = self.cdc_data_by_date['2021-02-01']
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(onvent_min=onvent_min)
-        received = list(self.db.query(filters))
+        filters = _create_filters(date=date)
+        self._assert_query_equal(expected, filters)
 
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_with_max_onvent(self):
-        onvent_max = 5000
+    def test_query_data_after_feb_1_2021(self):
+        start_date = FEB_1_2021
 
-        expected = []
-        for d in self.cdc_objs:
-           if d.onVentilatorCurrently <= onvent_max:
-              expected.append(d)
+        expected = self._expected_in_date_range(start_date=start_date)
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(onvent_max=onvent_max)
-        received = list(self.db.query(filters))
+        filters = _create_filters(start_date=start_date)
+        self._assert_query_equal(expected, filters)
 
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_with_max_onvent_and_min_onvent(self):
-        onvent_max = 4000
-        onvent_min = 1000
+    def test_query_data_before_mar_3_2021(self):
+        end_date = MAR_3_2021
 
-        expected = []
-        for d in self.cdc_objs:
-           if onvent_min <= d.onVentilatorCurrently <= onvent_max:
-              expected.append(d)
+        expected = self._expected_in_date_range(end_date=end_date)
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(onvent_min=onvent_min, onvent_max=onvent_max)
-        received = list(self.db.query(filters))
-
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+        filters = _create_filters(end_date=end_date)
+        self._assert_query_equal(expected, filters)
 
-    def test_query_with_max_onvent_and_min_onvent_conflicting(self):
-        onvent_max = 50
-        onvent_min = 1000
+    def test_query_with_conflicting_date_bounds(self):
+        start_date = OCT_1_2020
+        end_date = APR_1_2020
 
         expected = list()
 
-        filters = create_filters(onvent_min=onvent_min, onvent_max=onvent_max)
-        received = list(self.db.query(filters))
+        filters = _create_filters(start_date=start_date, end_date=end_date)
+        self._assert_query_equal(expected, filters)
 
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_with_max_death(self):
-        death_max = 2000
+    def test_query_with_bounds_and_a_specific_date(self):
+        start_date = FEB_1_2021
+        date = FEB_14_2021
+        end_date = MAR_1_2021
 
-        expected = []
-        for d in self.cdc_objs:
-           if d.death <= death_max:
-              expected.append(d)
+        expected = self._expected(date=date)
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(death_max=death_max)
-        received = list(self.db.query(filters))
-
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_with_min_death(self):
-        death_min = 10
+        filters = _create_filters(date=date, start_date=start_date, end_date=end_date)
+        self._assert_query_equal(expected, filters)
+
+    def test_query_with_count_bounds(self):
+        # Each count criterion on its own, with its counterpart, and conflicting
+        # with it, which must match nothing.
+        bounds = [
+            dict(hospitalized_min=100),
+            dict(hospitalized_max=2000),
+            dict(hospitalized_min=100, hospitalized_max=2000),
+            dict(icu_min=200),
+            dict(icu_max=4000),
+            dict(icu_min=100, icu_max=3000),
+            dict(onvent_min=500),
+            dict(onvent_max=5000),
+            dict(onvent_min=1000, onvent_max=4000),
+            dict(death_min=10),
+            dict(death_max=2000),
+            dict(death_min=10, death_max=2000),
+        ]
+        for criteria in bounds:
+            with self.subTest(**criteria):
+                expected = self._expected(**criteria)
+                self.assertGreater(len(expected), 0)
+
+                filters = _create_filters(**criteria)
+                self._assert_query_equal(expected, filters)
+
+        conflicting = [
+            dict(hospitalized_min=4000, hospitalized_max=100),
+            dict(icu_min=4000, icu_max=100),
+            dict(onvent_min=1000, onvent_max=50),
+            dict(death_min=20, death_max=10),
+        ]
+        for criteria in conflicting:
+            with self.subTest(**criteria):
+                filters = _create_filters(**criteria)
+                self._assert_query_equal([], filters)
+
+    def test_query_with_filter_without_field(self):
+        class PositiveFilter(AttributeFilter):
+            @classmethod
+            def get(cls, covid_data):
+                return covid_data.positive
+
+        positive_min = 100000
+        state = 'CA'
 
         expected = []
-        for d in self.cdc_objs:
-           if d.death >= death_min:
+        for d in self.cdc_data_by_state[state]:
+           if d.positive >= positive_min:
               expected.append(d)
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(death_min=death_min)
-        received = list(self.db.query(filters))
-
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_with_max_death_and_min_death(self):
-        death_max = 2000
-        death_min = 10
-
-        expected = []
-        for d in self.cdc_objs:
-           if death_min <= d.death <= death_max:
-              expected.append(d)
+        filters = [*_create_filters(state=state), PositiveFilter(operator.ge, positive_min)]
+        self._assert_query_equal(expected, filters)
+
+    def test_mask_of_filters_overriding_get_or_call(self):
+        filters = [
+            HospitalizedPlusIcuFilter(operator.ge, 5000),
+            LowerCaseStateFilter(operator.eq, 'ca'),
+        ]
+        for f in filters:
+            with self.subTest(filter=f):
+                self.assertFalse(f.reads_field())
+                self.assertFalse(f.compares_column())
+                expected = [d for d in self.cdc_objs if f(d)]
+                self.assertGreater(len(expected), 0)
+                self.assertEqual(expected, list(itertools.compress(self.cdc_objs, f.mask(self.db))))
+
+    def test_query_with_filters_overriding_get_or_call(self):
+        filters = [
+            [HospitalizedPlusIcuFilter(operator.ge, 5000)],
+            [LowerCaseStateFilter(operator.eq, 'ca')],
+            [*_create_filters(death_min=1000), LowerCaseStateFilter(operator.eq, 'ca')],
+            [DayOfMonthFilter(operator.le, 3), *_create_filters(start_date=FEB_1_2021)],
+        ]
+        for fs in filters:
+            with self.subTest(filters=fs):
+                expected = [d for d in self.cdc_objs if all(f(d) for f in fs)]
+                self.assertGreater(len(expected), 0)
+                self._assert_query_equal(expected, fs)
+
+    def test_query_with_filter_overriding_values(self):
+        f = NextDayFilter(operator.eq, FEB_2_2021)
+        self.assertFalse(f.compares_column())
+        expected = list(itertools.compress(self.cdc_objs, f.mask(self.db)))
         self.assertGreater(len(expected), 0)
+        self.assertTrue(all(d.date.date() == FEB_1_2021 for d in expected))
 
-        filters = create_filters(death_min=death_min, death_max=death_max)
-        received = list(self.db.query(filters))
-
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
-
-    def test_query_with_max_death_and_min_death_conflicting(self):
-        death_max = 10
-        death_min = 20
-
-        expected = list()
-
-        filters = create_filters(death_min=death_min, death_max=death_max)
-        received = list(self.db.query(filters))
-
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+        self._assert_query_equal(expected, [f])
 
     def test_query_data_state_CA(self):
         state = 'CA'
@@ -338,9 +411,8 @@ class TestQuery(unittest.TestCase):
         expected = self.cdc_data_by_state[state]
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(state=state)
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+        filters = _create_filters(state=state)
+        self._assert_query_equal(expected, filters)
 
     def test_query_data_state_invalid(self):
         state = 'KK'
@@ -348,9 +420,8 @@ class TestQuery(unittest.TestCase):
         expected = self.cdc_data_by_state[state]
         self.assertEqual(len(expected), 0)
 
-        filters = create_filters(state=state)
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+        filters = _create_filters(state=state)
+        self._assert_query_equal(expected, filters)
 
 
     ###########################
@@ -358,138 +429,115 @@ class TestQuery(unittest.TestCase):
     ###########################
 
     def test_query_data_on_2021_march_2_with_max_hospitalized(self):
-        date = datetime.date(2021, 3, 2)
+        date = MAR_2_2021
         hospitalized_max = 2000
 
-        data_03_02_2021 = self.cdc_data_by_date['2021-03-02']
-        expected = []
-        for d in data_03_02_2021:
-           if d.hospitalizedCurrently <= hospitalized_max:
-              expected.append(d)
+        expected = self._expected(date=date, hospitalized_max=hospitalized_max)
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(date=date, hospitalized_max=hospitalized_max)
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+        filters = _create_filters(date=date, hospitalized_max=hospitalized_max)
+        self._assert_query_equal(expected, filters)
 
     def test_query_data_on_2021_march_2_with_min_hospitalized(self):
-        date = datetime.date(2021, 3, 2)
+        date = MAR_2_2021
         hospitalized_min = 100
 
-        data_03_02_2021 = self.cdc_data_by_date['2021-03-02']
-        expected = []
-        for d in data_03_02_2021:
-           if d.hospitalizedCurrently >= hospitalized_min:
-              expected.append(d)
+        expected = self._expected(date=date, hospitalized_min=hospitalized_min)
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(date=date, hospitalized_min=hospitalized_min)
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+        filters = _create_filters(date=date, hospitalized_min=hospitalized_min)
+        self._assert_query_equal(expected, filters)
 
     def test_query_data_in_march_with_min_icu_and_max_icu(self):
-        start_date = datetime.date(2021, 1, 1)
-        end_date = datetime.date(2021, 3, 1)
+        start_date = JAN_1_2021
+        end_date = MAR_1_2021
         icu_max = 1000
         icu_min = 200
       
-        s_date = datetime.datetime(2021, 1, 1)
-        e_date = datetime.datetime(2021, 3, 1)
 
-        expected = []
-        for d in self.cdc_objs:
-           if s_date <= d.date <= e_date and icu_min <= d.inIcuCurrently <= icu_max:
-              expected.append(d)
+        expected = self._expected(
+            start_date=start_date, end_date=end_date,
+            icu_min=icu_min, icu_max=icu_max,
+        )
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(
+        filters = _create_filters(
             start_date=start_date, end_date=end_date,
             icu_min=icu_min, icu_max=icu_max,
         )
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+        self._assert_query_equal(expected, filters)
 
     def test_query_data_in_january_with_hospitalized_bounds_and_max_icu(self):
-        start_date = datetime.date(2021, 1, 1)
-        end_date = datetime.date(2021, 1, 31)
-        s_date = datetime.datetime(2021, 1, 1)
-        e_date = datetime.datetime(2021, 1, 31)
+        start_date = JAN_1_2021
+        end_date = JAN_31_2021
         hospitalized_max = 4000
         hospitalized_min = 100
         icu_max = 200
 
-        expected = []
-        for d in self.cdc_objs:
-           if s_date <= d.date <= e_date and hospitalized_min <= d.hospitalizedCurrently <= hospitalized_max and d.inIcuCurrently <= icu_max:
-              expected.append(d)
+        expected = self._expected(
+            start_date=start_date, end_date=end_date,
+            hospitalized_min=hospitalized_min, hospitalized_max=hospitalized_max,
+            icu_max=icu_max
+        )
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(
+        filters = _create_filters(
             start_date=start_date, end_date=end_date,
             hospitalized_min=hospitalized_min, hospitalized_max=hospitalized_max,
             icu_max=icu_max
         )
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+        self._assert_query_equal(expected, filters)
 
     def test_query_data_in_march_with_hospitalized_and_onvent_bounds(self):
-        start_date = datetime.date(2021, 3, 1)
-        end_date = datetime.date(2021, 3, 31)
-        s_date = datetime.datetime(2021, 3, 1)
-        e_date = datetime.datetime(2021, 3, 31)
+        start_date = MAR_1_2021
+        end_date = MAR_31_2021
         hospitalized_max = 4000
         hospitalized_min = 100
         onvent_max = 2000
         onvent_min = 10
 
-        expected = []
-        for d in self.cdc_objs:
-           if s_date <= d.date <= e_date and hospitalized_min <= d.hospitalizedCurrently <= hospitalized_max and \
-              onvent_min <= d.onVentilatorCurrently <= onvent_max:
-              expected.append(d)
+        expected = self._expected(
+            start_date=start_date, end_date=end_date,
+            hospitalized_min=hospitalized_min, hospitalized_max=hospitalized_max,
+            onvent_min=onvent_min, onvent_max=onvent_max
+        )
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(
+        filters = _create_filters(
             start_date=start_date, end_date=end_date,
             hospitalized_min=hospitalized_min, hospitalized_max=hospitalized_max,
             onvent_min=onvent_min, onvent_max=onvent_max
         )
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+        self._assert_query_equal(expected, filters)
 
     def test_query_data_in_winter_with_hospitalized_and_icu_bounds_and_max_death(self):
-        start_date = datetime.date(2021, 1, 1)
-        end_date = datetime.date(2021, 3, 1)
-        s_date = datetime.datetime(2021, 1, 1)
-        e_date = datetime.datetime(2021, 3, 1)
+        start_date = JAN_1_2021
+        end_date = MAR_1_2021
         hospitalized_max = 3000
         hospitalized_min = 500
         icu_max = 20000
         icu_min = 100
         death_max = 3000
 
-        expected = []
-        for d in self.cdc_objs:
-           if s_date <= d.date <= e_date and hospitalized_min <= d.hospitalizedCurrently <= hospitalized_max and \
-              icu_min <= d.inIcuCurrently <= icu_max and \
-              d.death <= death_max:
-              expected.append(d)
+        expected = self._expected(
+            start_date=start_date, end_date=end_date,
+            hospitalized_min=hospitalized_min, hospitalized_max=hospitalized_max,
+            icu_min=icu_min, icu_max=icu_max,
+            death_max=death_max
+        )
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(
+        filters = _create_filters(
             start_date=start_date, end_date=end_date,
             hospitalized_min=hospitalized_min, hospitalized_max=hospitalized_max,
             icu_min=icu_min, icu_max=icu_max,
             death_max=death_max
         )
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+        self._assert_query_equal(expected, filters)
 
     def test_query_data_in_winter_with_all_bounds(self):
-        start_date = datetime.date(2021, 1, 1)
-        end_date = datetime.date(2021, 3, 1)
-        s_date = datetime.datetime(2021, 1, 1)
-        e_date = datetime.datetime(2021, 3, 1)
+        start_date = JAN_1_2021
+        end_date = MAR_1_2021
         hospitalized_max = 5000
         hospitalized_min = 1000
         icu_max = 2500
@@ -499,30 +547,27 @@ class TestQuery(unittest.TestCase):
         death_max = 10000
         death_min = 500
 
-        expected = []
-        for d in self.cdc_objs:
-           if s_date <= d.date <= e_date and hospitalized_min <= d.hospitalizedCurrently <= hospitalized_max and \
-              icu_min <= d.inIcuCurrently <= icu_max and \
-              onvent_min <= d.onVentilatorCurrently <= onvent_max and \
-              death_min <= d.death <= death_max:
-              expected.append(d)
+        expected = self._expected(
+            start_date=start_date, end_date=end_date,
+            hospitalized_min=hospitalized_min, hospitalized_max=hospitalized_max,
+            icu_min=icu_min, icu_max=icu_max,
+            onvent_min=onvent_min, onvent_max=onvent_max,
+            death_min=death_min, death_max=death_max
+        )
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(
+        filters = _create_filters(
             start_date=start_date, end_date=end_date,
             hospitalized_min=hospitalized_min, hospitalized_max=hospitalized_max,
             icu_min=icu_min, icu_max=icu_max,
             onvent_min=onvent_min, onvent_max=onvent_max,
             death_min=death_min, death_max=death_max
         )
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+        self._assert_query_equal(expected, filters)
 
     def test_query_data_in_winter_with_all_bounds_in_OH(self):
-        start_date = datetime.date(2021, 1, 1)
-        end_date = datetime.date(2021, 3, 1)
-        s_date = datetime.datetime(2021, 1, 1)
-        e_date = datetime.datetime(2021, 3, 1)
+        start_date = JAN_1_2021
+        end_date = MAR_1_2021
         hospitalized_max = 5000
         hospitalized_min = 1000
         icu_max = 2500
@@ -533,17 +578,17 @@ class TestQuery(unittest.TestCase):
         death_min = 500
         state = 'OH'
 
-        expected = []
-        for d in self.cdc_objs:
-           if s_date <= d.date <= e_date and hospitalized_min <= d.hospitalizedCurrently <= hospitalized_max and \
-              icu_min <= d.inIcuCurrently <= icu_max and \
-              onvent_min <= d.onVentilatorCurrently <= onvent_max and \
-              death_min <= d.death <= death_max and \
-              d.state == state:
-              expected.append(d)
+        expected = self._expected(
+            start_date=start_date, end_date=end_date,
+            hospitalized_min=hospitalized_min, hospitalized_max=hospitalized_max,
+            icu_min=icu_min, icu_max=icu_max,
+            onvent_min=onvent_min, onvent_max=onvent_max,
+            death_min=death_min, death_max=death_max,
+            state=state
+        )
         self.assertGreater(len(expected), 0)
 
-        filters = create_filters(
+        filters = _create_filters(
             start_date=start_date, end_date=end_date,
             hospitalized_min=hospitalized_min, hospitalized_max=hospitalized_max,
             icu_min=icu_min, icu_max=icu_max,
@@ -551,8 +596,81 @@ class TestQuery(unittest.TestCase):
             death_min=death_min, death_max=death_max,
             state=state
         )
-        received = list(self.db.query(filters))
-        self.assertEqual(expected, received, msg="Computed results do not match expected results.")
+        self._assert_query_equal(expected, filters)
+
+class TestLoadGolden(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = pathlib.Path(tmpdir.name) / 'expected_results.json'
+
+    def test_current_golden_is_loaded(self):
+        self.path.write_text(json.dumps({'source_sha256': _source_digest(), 'results': {'state=CA': 'ff'}}))
+        self.assertEqual(load_golden(self.path), {'state=CA': 'ff'})
+
+    def test_missing_stale_or_malformed_golden_is_ignored(self):
+        malformed = [
+            None,
+            json.dumps({'source_sha256': 'stale', 'results': {'state=CA': 'ff'}}),
+            '<<<<<<< HEAD\n{"results": {}}\n>>>>>>> branch\n',
+            json.dumps({'results': {'state=CA': 'ff'}}),
+            json.dumps({'source_sha256': _source_digest()}),
+            json.dumps({'source_sha256': _source_digest(), 'results': ['ff']}),
+            json.dumps(['ff']),
+        ]
+        for content in malformed:
+            with self.subTest(content=content):
+                if content is not None:
+                    self.path.write_text(content)
+                self.assertEqual(load_golden(self.path), {})
+
+
+class CountingDatabase(CDCTrackingDatabase):
+    """A database counting how many values queries read from its columns."""
+
+    def __init__(self, cdcObjs):
+        super().__init__(cdcObjs)
+        self.reads = 0
+
+    def column(self, name):
+        column = super().column(name)
+        db = self
+
+        class CountingColumn:
+            def __len__(self):
+                return len(column)
+
+            def __getitem__(self, row):
+                db.reads += 1
+                return column[row]
+
+        return CountingColumn()
+
+
+class TestLimit(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cdc_objs = load_fixture(TEST_COVID_FILE).cdc_objs
+
+    def test_limit_stops_consuming_after_n_values(self):
+        source = iter(self.cdc_objs)
+        received = list(limit(source, 5))
+        self.assertEqual(received, self.cdc_objs[:5])
+        # The next value is still in the source, not consumed and dropped.
+        self.assertIs(next(source), self.cdc_objs[5])
+
+    def test_limit_of_zero_or_none_does_not_limit(self):
+        for n in (0, None):
+            with self.subTest(n=n):
+                self.assertEqual(list(limit(iter(self.cdc_objs), n)), self.cdc_objs)
+
+    def test_limited_query_stops_reading_rows(self):
+        db = CountingDatabase(self.cdc_objs)
+        filters = _create_filters(hospitalized_min=1)
+        received = list(limit(db.query(filters), 5))
+        self.assertEqual(len(received), 5)
+        self.assertLess(db.reads, 100)
+
 
 if __name__ == '__main__':
     unittest.main()